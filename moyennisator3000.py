@@ -7,20 +7,29 @@ with Brevet statistics calculation.
 
 import os
 import sys
+import atexit
+import hashlib
+import hmac
 import logging
+import queue
+import re
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+from operator import attrgetter
 from datetime import date, datetime
-from io import BytesIO
 from typing import List, Dict, Optional, Tuple
-from collections import defaultdict
 from uuid import uuid4
 
-from flask import Flask, render_template, request, flash, redirect, url_for, jsonify, session, send_file
-from urllib.parse import urlparse
-from flask_babel import Babel, gettext
+from flask import Flask, g, render_template, request, flash, redirect, url_for, jsonify, session, send_file
+from werkzeug.http import generate_etag
+from flask_babel import Babel, gettext, lazy_gettext
 from flask_wtf import FlaskForm, CSRFProtect
 from wtforms import StringField, PasswordField, SubmitField
 from wtforms.validators import DataRequired, Length
-from weasyprint import HTML
 
 try:
     from pronotepy import Client
@@ -37,19 +46,29 @@ from pathlib import Path
 
 load_dotenv()
 
+# Request threads only enqueue log records; a background listener thread does the
+# file/console writes. Records are formatted by the QueueHandler (basicConfig format),
+# so the listener's handlers write the message as-is.
+log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, logging.FileHandler("pronote_web.log"), logging.StreamHandler())
+log_listener.start()
+atexit.register(log_listener.stop)
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("pronote_web.log"), logging.StreamHandler()],
+    handlers=[QueueHandler(log_queue)],
 )
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-# Load secret key from environment; fallback to a random key only for dev
-app.secret_key = os.environ.get("SECRET_KEY") or os.urandom(32)
+# Load secret key from environment; fallback to a random key only for dev.
+# Drawn once so sessions and CSRF tokens are signed with the same key.
+SECRET_KEY = os.environ.get("SECRET_KEY") or os.urandom(32)
+app.secret_key = SECRET_KEY
 # Enable CSRF protection
 app.config["WTF_CSRF_ENABLED"] = True
-app.config["WTF_CSRF_SECRET_KEY"] = os.environ.get("SECRET_KEY") or os.urandom(32)
+app.config["WTF_CSRF_SECRET_KEY"] = SECRET_KEY
 csrf = CSRFProtect()
 csrf.init_app(app)
 
@@ -59,18 +78,28 @@ app.config["LANGUAGES"] = {"fr": "Français", "en": "English", "es": "Español"}
 app.config["BABEL_DEFAULT_LOCALE"] = "fr"
 app.config["BABEL_DEFAULT_TIMEZONE"] = "UTC"
 
+# Language codes resolved once: ordered tuple for Accept-Language matching, set for membership
+LANGUAGE_CODES = tuple(app.config["LANGUAGES"])
+LANGUAGE_SET = frozenset(LANGUAGE_CODES)
+
 def get_locale():
+    # Resolved once per request: templates call this directly on every render
+    if "locale" not in g:
+        g.locale = _resolve_locale()
+    return g.locale
+
+def _resolve_locale():
     # 1) URL param
-    if "language" in request.args:
-        language = request.args["language"]
-        if language in app.config["LANGUAGES"]:
-            session["language"] = language
-            return language
+    language = request.args.get("language")
+    if language in LANGUAGE_SET:
+        session["language"] = language
+        return language
     # 2) Session
-    if "language" in session and session["language"] in app.config["LANGUAGES"]:
-        return session["language"]
+    language = session.get("language")
+    if language in LANGUAGE_SET:
+        return language
     # 3) Browser
-    return request.accept_languages.best_match(app.config["LANGUAGES"].keys()) or app.config["BABEL_DEFAULT_LOCALE"]
+    return request.accept_languages.best_match(LANGUAGE_CODES) or app.config["BABEL_DEFAULT_LOCALE"]
 
 babel = Babel()
 babel.init_app(app, default_locale="fr", locale_selector=get_locale)
@@ -90,41 +119,240 @@ try:
         with open(URLS_FILE, 'r', encoding='utf-8') as fh:
             data = json.load(fh)
             DEFAULT_URL_PRESETS = data.get('presets', []) if isinstance(data, dict) else []
-            logger.info(f"Loaded {len(DEFAULT_URL_PRESETS)} Pronote URL presets from {URLS_FILE}")
+            logger.info("Loaded %d Pronote URL presets from %s", len(DEFAULT_URL_PRESETS), URLS_FILE)
 except Exception as e:
-    logger.warning(f"Could not load URL presets: {e}")
+    logger.warning("Could not load URL presets: %s", e)
 
 # Make presets available in templates
 app.jinja_env.globals['url_presets'] = DEFAULT_URL_PRESETS
 
+# Preset url or name -> url (first matching preset wins), for resolving the login selection
+PRESET_URLS: Dict[str, str] = {}
+for preset in DEFAULT_URL_PRESETS:
+    if preset.get('url'):
+        PRESET_URLS.setdefault(preset['url'], preset['url'])
+        PRESET_URLS.setdefault(preset.get('name'), preset['url'])
+
+# Optional "scheme:" and "//host", then a path ending with /pronote or /eleve.html,
+# optionally followed by trailing slashes and one ";params" segment, then the end of the
+# string, a "?query" or a "#fragment". Whitespace is not stripped: URLs containing
+# tabs or newlines are rejected.
+PRONOTE_URL_RE = re.compile(
+    r"^(?:[A-Za-z][A-Za-z0-9+.-]*:)?+(?://[^/?#]*)?+"
+    r"[^?#]*/(?:pronote|eleve\.html)/*+(?:;[^/?#]*)?(?:[?#]|$)"
+)
+
+def is_valid_pronote_url(url: str) -> bool:
+    """True if the URL path ends with /pronote or /eleve.html (query strings and trailing slashes allowed)."""
+    return PRONOTE_URL_RE.match(url) is not None
+
+def resolve_pronote_url(selected_url, custom_url: str) -> Optional[str]:
+    """Pronote URL chosen on the login form (preset or custom), or None if it is not a valid one."""
+    # If user chose Other and provided a custom URL, use it
+    if selected_url == 'other' and custom_url:
+        chosen_url = custom_url
+    else:
+        # Preset by url or name; fallback to selected_url if it looks like a URL
+        selected_url = str(selected_url)
+        chosen_url = PRESET_URLS.get(selected_url, selected_url)
+    return chosen_url if is_valid_pronote_url(chosen_url) else None
+
 # ---------- Forms ----------
 
 class LoginForm(FlaskForm):
     """Form for Pronote login credentials."""
-    def __init__(self, *args, **kwargs):
-        super(LoginForm, self).__init__(*args, **kwargs)
-        self.username.label.text = gettext("Username")
-        self.password.label.text = gettext("Password")
-        self.submit.label.text = gettext("Analyze Grades")
-        self.username.render_kw = {"placeholder": gettext("Enter your Pronote username")}
-        self.password.render_kw = {"placeholder": gettext("Enter your Pronote password")}
-
-    username = StringField("Username", validators=[DataRequired(), Length(min=1, max=50)])
-    password = PasswordField("Password", validators=[DataRequired(), Length(min=1, max=100)])
-    submit = SubmitField("Analyze Grades")
+    # Lazy strings are resolved in the request's locale when the form is rendered
+    username = StringField(
+        lazy_gettext("Username"),
+        validators=[DataRequired(), Length(min=1, max=50)],
+        render_kw={"placeholder": lazy_gettext("Enter your Pronote username")},
+    )
+    password = PasswordField(
+        lazy_gettext("Password"),
+        validators=[DataRequired(), Length(min=1, max=100)],
+        render_kw={"placeholder": lazy_gettext("Enter your Pronote password")},
+    )
+    submit = SubmitField(lazy_gettext("Analyze Grades"))
 
 # ---------- Per-session data store ----------
-# For a small single-worker app this is fine.
-# If you scale to multiple workers/dynos, move this to Redis.
-STORE: Dict[str, Dict] = {}
+# In-process by default, which is fine for a single gunicorn worker.
+# Set REDIS_URL to share results between workers/dynos (requires `pip install redis`).
+
+SESSION_TTL = int(os.environ.get("SESSION_TTL", "3600"))
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", "1000"))
+
+class MemorySessionStore:
+    """Per-session results kept in this process, evicting the least recently used beyond maxsize."""
+
+    def __init__(self, maxsize: int):
+        self._maxsize = maxsize
+        self._data: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid: str) -> Optional[Dict]:
+        with self._lock:
+            payload = self._data.get(sid)
+            if payload is not None:
+                self._data.move_to_end(sid)
+            return payload
+
+    def set(self, sid: str, payload: Dict) -> None:
+        with self._lock:
+            self._data[sid] = payload
+            self._data.move_to_end(sid)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+class RedisSessionStore:
+    """Per-session results kept in Redis as JSON, expiring after SESSION_TTL seconds."""
+
+    def __init__(self, client, ttl: int):
+        self._redis = client
+        self._ttl = ttl
+
+    def get(self, sid: str) -> Optional[Dict]:
+        raw = self._redis.get(f"sess:{sid}")
+        return json.loads(raw) if raw else None
+
+    def set(self, sid: str, payload: Dict) -> None:
+        self._redis.setex(f"sess:{sid}", self._ttl, app.json.dumps(payload))
+
+def create_session_store():
+    redis_url = os.environ.get("REDIS_URL")
+    if not redis_url:
+        return MemorySessionStore(MAX_SESSIONS)
+    try:
+        import redis
+    except ImportError:
+        logger.warning("REDIS_URL is set but the redis package is not installed; keeping sessions in memory")
+        return MemorySessionStore(MAX_SESSIONS)
+    logger.info("Storing session results in Redis")
+    return RedisSessionStore(redis.Redis.from_url(redis_url), SESSION_TTL)
+
+STORE = create_session_store()
+
+# ---------- Login result cache ----------
+# A refresh or PWA auto-login with the same credentials shortly after a successful
+# login reuses its results instead of fetching everything from Pronote again.
+# Entries are keyed by an HMAC of (url, username, password, locale): no credentials are kept,
+# and the cached message/performance level/JSON are only reused in the locale they were built in.
+
+LOGIN_CACHE_TTL = int(os.environ.get("LOGIN_CACHE_TTL", "300"))
+LOGIN_CACHE_SIZE = 256
+
+class LoginCache:
+    """Bounded, expiring map of credential HMAC -> (success message, results)."""
+
+    def __init__(self, secret: bytes, ttl: int, maxsize: int):
+        self._secret = secret
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[float, str, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, url: str, username: str, password: str, locale: str) -> str:
+        message = "\0".join((url, username, password, locale)).encode("utf-8")
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def set(self, key: str, message: str, results: Dict) -> None:
+        if self._ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, message, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+LOGIN_CACHE = LoginCache(
+    SECRET_KEY if isinstance(SECRET_KEY, bytes) else SECRET_KEY.encode("utf-8"),
+    LOGIN_CACHE_TTL,
+    LOGIN_CACHE_SIZE,
+)
+
+# ---------- Grade mappings ----------
+# Pronote acquisition abbreviations -> palier points (/50) and display labels
+PALIER_POINTS: Dict[str, int] = {"A+": 50, "A": 40, "C": 25, "E": 10}
+GRADE_DISPLAY: Dict[str, str] = {"A+": "V+", "A": "V", "C": "J", "E": "R"}
+
+# Average palier points -> snapped palier, same indexing as PERFORMANCE_LEVELS:
+# >= 45 -> V+ (50), >= 32.5 -> V (40), >= 17.5 -> J (25), < 17.5 -> R (10)
+PALIER_THRESHOLDS = (17.5, 32.5, 45)
+PALIER_SNAPPED = (10, 25, 40, 50)
+PALIER_LABELS = ("R", "J", "V", "V+")
+
+# Performance level by total /400: PERFORMANCE_LEVELS[i] applies from PERFORMANCE_THRESHOLDS[i - 1] upwards
+PERFORMANCE_THRESHOLDS = (200, 240, 280, 320, 360)
+PERFORMANCE_LEVELS = (
+    lazy_gettext("Below pass level"),
+    lazy_gettext("Pass level"),
+    lazy_gettext("Satisfactory (Mention Assez Bien possible)"),
+    lazy_gettext("Good (Mention Bien possible)"),
+    lazy_gettext("Excellent (Mention Très Bien possible)"),
+    lazy_gettext("Outstanding (Mention Très Bien avec Félicitations)"),
+)
+
+# pronotepy error substring -> friendly message, first match wins.
+# " 23" also covers "Unknown error from pronote: 23" (unknown username).
+CONNECTION_ERRORS = (
+    ("Decryption failed while trying to un pad", lazy_gettext("Incorrect password. / Mot de passe incorrect.")),
+    (" 23", lazy_gettext("Incorrect username. / Nom d'utilisateur incorrect.")),
+)
+
+# Fixed route messages, translated in the request's locale when converted to str
+MSG_INVALID_URL = lazy_gettext("Please select or enter a valid Pronote URL that ends with /pronote or /eleve.html.")
+MSG_CHECK_INPUT = lazy_gettext("Please check your input and try again.")
+MSG_INVALID_REQUEST = lazy_gettext("Invalid request")
+MSG_MISSING_CREDENTIALS = lazy_gettext("Missing credentials")
+MSG_NO_DATA = lazy_gettext("No data available. Please login first.")
+
+
+def palier_score(count: int, points_sum: int) -> Dict:
+    """Snap an average of palier points to its palier (see PALIER_THRESHOLDS)."""
+    avg_points = points_sum / count
+    i = bisect_right(PALIER_THRESHOLDS, avg_points)
+    snapped_points = PALIER_SNAPPED[i]
+    palier_display = PALIER_LABELS[i]
+
+    return {
+        "count": count,
+        "avg_points_50": float(snapped_points),
+        "avg_points_20": round(snapped_points * 0.4, 2),
+        "palier": palier_display,
+        "raw_avg": round(avg_points, 2),  # For debugging
+    }
+
+@lru_cache(maxsize=256)
+def parse_pillar(pillar: str) -> Tuple[str, ...]:
+    """Split a comma-separated pillar_prefix into its domains (few distinct values, so cached)."""
+    return tuple(s.strip() for s in pillar.split(','))
+
+def parse_iso_date(value: str) -> Optional[date]:
+    """Date from a YYYY-MM-DD or ISO datetime string, None if it is neither."""
+    try:
+        if len(value) == 10:
+            return date.fromisoformat(value)
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        return None
 
 # ---------- Analyzer (stateless per request) ----------
 
 class PronoteAnalyzer:
     """Main class for analyzing Pronote academic data (stateless)."""
 
-    def __init__(self):
-        self.fixed_url = "https://4170004n.index-education.net/pronote/eleve.html"
+    def __init__(self, pronote_url: str = "https://4170004n.index-education.net/pronote/eleve.html"):
+        self.fixed_url = pronote_url
 
     def connect_and_fetch(self, username: str, password: str) -> Tuple[bool, str, List[Dict], Dict, List]:
         """
@@ -133,16 +361,14 @@ class PronoteAnalyzer:
         """
         client: Optional[Client] = None
         try:
-            logger.info(f"Attempting to connect to Pronote as {username} with password {password}...")
-            # Use the fixed_url attribute unless overridden in this call via thread-local/session
-            pronote_url = getattr(self, 'fixed_url', None) or self.fixed_url
-            client = Client(pronote_url, username, password)
+            logger.info("Attempting to connect to Pronote as %s...", username)
+            client = Client(self.fixed_url, username, password)
 
             if not getattr(client, "logged_in", False):
                 logger.error("Login failed. Please check your credentials.")
                 return False, gettext("Login failed. Please check your credentials."), [], {}, []
 
-            logger.info(f"Successfully connected to Pronote!")
+            logger.info("Successfully connected to Pronote!")
 
             # Fetch evaluations immediately, don't store client anywhere
             evaluations_processed: List[Dict] = []
@@ -163,16 +389,26 @@ class PronoteAnalyzer:
                     info = {}
                 return True, gettext("No periods found"), [], info, []
 
+            process = self._process_evaluation
+            add_raw = evaluations_raw.append
+            add_processed = evaluations_processed.append
+            skipped = 0
+            last_error: Optional[Exception] = None
+
+            # Periods are fetched one after the other on purpose: each period.evaluations
+            # is a request on the client's single Pronote session, which numbers its
+            # requests sequentially and rejects them if they arrive out of order.
             for period in periods:
                 for evaluation in getattr(period, "evaluations", []):
+                    add_raw(evaluation)
                     try:
-                        evaluations_raw.append(evaluation)
-                        ev = self._process_evaluation(evaluation)
-                        if ev:
-                            evaluations_processed.append(ev)
+                        add_processed(process(evaluation))
                     except Exception as e:
-                        logger.warning(f"Error processing evaluation: {e}")
-                        continue
+                        skipped += 1
+                        last_error = e
+
+            if skipped:
+                logger.warning("Skipped %d evaluations that could not be processed (last error: %s)", skipped, last_error)
 
             # gather student info from client if available
             info = {}
@@ -186,179 +422,159 @@ class PronoteAnalyzer:
             except Exception:
                 info = {}
 
-            logger.info(f"Successfully fetched {len(evaluations_processed)} evaluations")
+            logger.info("Successfully fetched %d evaluations", len(evaluations_processed))
             return True, gettext("Successfully fetched %(n)d evaluations", n=len(evaluations_processed)), evaluations_processed, info, evaluations_raw
 
         except Exception as e:
             msg = str(e)
 
             # Map cryptic errors to friendly bilingual messages
-            if "Decryption failed while trying to un pad" in msg:
-                error_msg = gettext("Incorrect password. / Mot de passe incorrect.")
-            elif "Unknown error from pronote: 23" in msg or " 23" in msg:
-                error_msg = gettext("Incorrect username. / Nom d'utilisateur incorrect.")
+            for needle, friendly in CONNECTION_ERRORS:
+                if needle in msg:
+                    error_msg = str(friendly)
+                    break
             else:
                 error_msg = gettext("Unexpected connection error / Erreur de connexion inconnue: %(m)s", m=msg)
 
-            logger.error(f"Connection error mapped: {error_msg}")
-            return False, error_msg, [], {}
+            logger.error("Connection error mapped: %s", error_msg)
+            return False, error_msg, [], {}, []
         finally:
             # Best effort cleanup (pronotepy doesn't necessarily need explicit close)
             del client
 
-    def grade_abbreviation_to_palier(self, abbrev: str) -> int:
-        """Convert abbreviation (A+, A, C, E) to palier points (50, 40, 25, 10)."""
-        mapping = {"A+": 50, "A": 40, "C": 25, "E": 10}
-        return mapping.get(abbrev, 0)
-
-    def convert_grade_for_display(self, grade: str) -> str:
-        mapping = {"A+": "V+", "A": "V", "C": "J", "E": "R"}
-        return mapping.get(grade, grade)
-
-    def count_domains_and_acquisitions(self, evaluations_raw: List) -> Tuple[Dict, List]:
+    def _scan_acquisitions(self, evaluations_raw: List) -> Tuple[Dict[str, List], List]:
         """
-        Count acquisitions per domain and track DNL HG acquisitions.
-        Only tracks acquisitions with empty pillar_prefix where subject is exactly "DNL HG".
-        Returns (domain_counts: Dict[subdomain -> count], dnl_hg_acquisitions: List[acq dicts])
+        Walk every acquisition once and collect everything the Brevet stats need.
+        Returns (domain_totals: Dict[subdomain -> [count, palier points sum]], dnl_hg_acquisitions: List[acq dicts])
         """
-        domain_counts = defaultdict(int)
+        domain_totals: Dict[str, List] = {}
         dnl_hg_acquisitions = []
+        to_palier = PALIER_POINTS.get
+        acquisition_fields = attrgetter("pillar_prefix", "abbreviation")
 
         for evaluation in evaluations_raw:
             eval_subject = getattr(getattr(evaluation, "subject", None), "name", "Unknown")
-            
-            for acq in getattr(evaluation, "acquisitions", []):
-                pillar = getattr(acq, "pillar_prefix", "")
-                abbrev = getattr(acq, "abbreviation", "")
-                
-                if pillar:
-                    # Split comma-separated domains
-                    for subdomain in [s.strip() for s in pillar.split(',')]:
-                        domain_counts[subdomain] += 1
-                else:
-                    # Only track DNL HG acquisitions (ignore other empty pillar_prefix)
-                    if eval_subject == "DNL HG":
-                        dnl_hg_acquisitions.append({
-                            "evaluation_name": getattr(evaluation, "name", "Unknown"),
-                            "subject": eval_subject,
-                            "abbreviation": abbrev,
-                            "palier_points": self.grade_abbreviation_to_palier(abbrev),
-                        })
-
-        return dict(domain_counts), dnl_hg_acquisitions
 
-    def compute_domain_scores(self, evaluations_raw: List) -> Dict:
-        """
-        Compute per-domain scores based on threshold-snapping of average palier points.
-        Each domain gets one of: V+ (50), V (40), J (25), R (10) based on average points.
-        Returns dict: { domain_name: { "count": int, "avg_points_50": float, "avg_points_20": float, "palier": str } }
-        """
-        domain_palier_points = defaultdict(list)  # domain -> [points, points, ...]
-        
-        # Collect palier points per domain
-        for evaluation in evaluations_raw:
             for acq in getattr(evaluation, "acquisitions", []):
-                pillar = getattr(acq, "pillar_prefix", "")
-                abbrev = getattr(acq, "abbreviation", "")
-                
-                if pillar:
-                    palier_points = self.grade_abbreviation_to_palier(abbrev)
-                    for subdomain in [s.strip() for s in pillar.split(',')]:
-                        domain_palier_points[subdomain].append(palier_points)
-
-        # Compute average points per domain and snap to nearest palier
-        domain_scores = {}
-        for domain, points_list in domain_palier_points.items():
-            avg_points = sum(points_list) / len(points_list)
-            
-            # Threshold-based snapping:
-            # >= 45 → V+ (50), >= 32.5 → V (40), >= 17.5 → J (25), < 17.5 → R (10)
-            if avg_points >= 45:
-                snapped_points = 50
-                palier_display = "V+"
-            elif avg_points >= 32.5:
-                snapped_points = 40
-                palier_display = "V"
-            elif avg_points >= 17.5:
-                snapped_points = 25
-                palier_display = "J"
-            else:
-                snapped_points = 10
-                palier_display = "R"
-            
-            snapped_points_20 = round(snapped_points * 0.4, 2)
-            
-            domain_scores[domain] = {
-                "count": len(points_list),
-                "avg_points_50": float(snapped_points),
-                "avg_points_20": snapped_points_20,
-                "palier": palier_display,
-                "raw_avg": round(avg_points, 2),  # For debugging
-            }
-
-        return domain_scores
+                # pronotepy Acquisitions always have both; defaults only for other objects
+                try:
+                    pillar, abbrev = acquisition_fields(acq)
+                except AttributeError:
+                    pillar = getattr(acq, "pillar_prefix", "")
+                    abbrev = getattr(acq, "abbreviation", "")
+                palier_points = to_palier(abbrev, 0)
 
-    def _process_evaluation(self, evaluation) -> Optional[Dict]:
+                if pillar:
+                    for subdomain in parse_pillar(pillar):
+                        totals = domain_totals.get(subdomain)
+                        if totals is None:
+                            domain_totals[subdomain] = [1, palier_points]
+                        else:
+                            totals[0] += 1
+                            totals[1] += palier_points
+                elif eval_subject == "DNL HG":
+                    # Only track DNL HG acquisitions (ignore other empty pillar_prefix)
+                    dnl_hg_acquisitions.append({
+                        "evaluation_name": getattr(evaluation, "name", "Unknown"),
+                        "subject": eval_subject,
+                        "abbreviation": abbrev,
+                        "palier_points": palier_points,
+                    })
+
+        return domain_totals, dnl_hg_acquisitions
+
+    def _score_domains(self, domain_totals: Dict[str, List]) -> Dict:
+        """Snap each domain's average palier points (from _scan_acquisitions) to its palier."""
+        return {
+            domain: palier_score(count, points_sum)
+            for domain, (count, points_sum) in domain_totals.items()
+        }
+
+    def _process_evaluation(self, evaluation) -> Dict:
+        """Turn a pronotepy Evaluation into a results-page dict; errors propagate to the caller."""
+        # pronotepy Evaluations always carry these attributes: read them directly and
+        # only fall back to per-field defaults for objects that don't
         try:
+            acquisitions = evaluation.acquisitions
+            # Interned: every evaluation of a subject shares one key for the per-subject aggregation
+            subject_name = sys.intern(evaluation.subject.name)
+            raw_date = evaluation.date
+            name = evaluation.name
+            coefficient = evaluation.coefficient
+        except AttributeError:
             acquisitions = getattr(evaluation, "acquisitions", [])
-            points: List[int] = []
-            grades: List[str] = []
-
-            for acq in acquisitions:
-                raw = getattr(acq, "abbreviation", "")
-                if raw:
-                    grades.append(self.convert_grade_for_display(raw))
-                    points.append(self.grade_abbreviation_to_palier(raw))
-
-            avg_points = sum(points) / len(points) if points else 0
             subject_obj = getattr(evaluation, "subject", None)
             subject_name = getattr(subject_obj, "name", "Unknown") if subject_obj else "Unknown"
-
-            # Normalize/keep a datetime.date object for sorting, and a display string
             raw_date = getattr(evaluation, "date", None)
-            date_obj = None
-            if isinstance(raw_date, date):
-                date_obj = raw_date
-            elif isinstance(raw_date, datetime):
-                date_obj = raw_date.date()
-            else:
-                # try to parse ISO-like strings, otherwise leave None
-                try:
-                    date_obj = datetime.fromisoformat(str(raw_date)).date()
-                except Exception:
-                    date_obj = None
+            name = getattr(evaluation, "name", "Unnamed")
+            coefficient = getattr(evaluation, "coefficient", 1)
 
-            # Display dates as dd/mm/YYYY when we have a date object
-            date_display = date_obj.strftime("%d/%m/%Y") if date_obj else str(raw_date or "Unknown")
+        grades: List[str] = []
+        points_sum = 0
+        add_grade = grades.append
+        to_display = GRADE_DISPLAY.get
+        to_palier = PALIER_POINTS.get
 
-            return {
-                "subject": subject_name,
-                "date": date_display,
-                "date_obj": date_obj,
-                "name": getattr(evaluation, "name", "Unnamed"),
-                "coefficient": getattr(evaluation, "coefficient", 1),
-                "grades": grades,
-                "average_points": round(avg_points, 2),
-            }
-        except Exception as e:
-            logger.warning(f"Error processing individual evaluation: {e}")
-            return None
+        for acq in acquisitions:
+            try:
+                raw = acq.abbreviation
+            except AttributeError:
+                continue
+            if raw:
+                add_grade(to_display(raw, raw))
+                points_sum += to_palier(raw, 0)
+
+        # every graded acquisition contributes exactly one display grade
+        avg_points = points_sum / len(grades) if grades else 0
+
+        # Normalize/keep a datetime.date object for sorting, and a display string
+        # datetime first: it is a date subclass, and sorting needs plain dates only
+        if isinstance(raw_date, datetime):
+            date_obj = raw_date.date()
+        elif isinstance(raw_date, date):
+            date_obj = raw_date
+        elif raw_date is None:
+            date_obj = None
+        else:
+            # try to parse ISO-like strings, otherwise leave None
+            date_obj = parse_iso_date(str(raw_date))
+
+        # Display dates as dd/mm/YYYY when we have a date object
+        if date_obj:
+            date_display = f"{date_obj.day:02d}/{date_obj.month:02d}/{date_obj.year}"
+        else:
+            date_display = str(raw_date or "Unknown")
+
+        return {
+            "subject": subject_name,
+            "date": date_display,
+            "date_obj": date_obj,
+            "name": name,
+            "coefficient": coefficient,
+            "grades": grades,
+            "average_points": round(avg_points, 2),
+        }
 
     def calculate_subject_averages(self, evaluations: List[Dict]) -> Dict[str, float]:
         if not evaluations:
             return {}
-        totals = defaultdict(lambda: {"points": 0.0, "coeffs": 0.0})
+        # subject -> [weighted points, coefficients]
+        totals: Dict[str, List[float]] = {}
         for ev in evaluations:
             coeff = float(ev.get("coefficient", 0) or 0)
             avg = float(ev.get("average_points", 0) or 0)
             subject = ev.get("subject", "Unknown")
-            totals[subject]["points"] += avg * coeff
-            totals[subject]["coeffs"] += coeff
+            t = totals.get(subject)
+            if t is None:
+                totals[subject] = [avg * coeff, coeff]
+            else:
+                t[0] += avg * coeff
+                t[1] += coeff
         out: Dict[str, float] = {}
         # Convert subject averages from the internal 0-50 scale to 0-20 for display:
         # factor = 20 / 50 = 0.4 (same conversion used for overall moyenne_sur_20)
-        for subject, v in totals.items():
-            avg_50 = (v["points"] / v["coeffs"]) if v["coeffs"] > 0 else 0.0
+        for subject, (points, coeffs) in totals.items():
+            avg_50 = (points / coeffs) if coeffs > 0 else 0.0
             avg_20 = round(avg_50 * 0.4, 2)
             out[subject] = avg_20
         return out
@@ -379,43 +595,22 @@ class PronoteAnalyzer:
                     "dnl_hg_acquisitions": [],
                 }
 
-            domain_scores = self.compute_domain_scores(evaluations_raw)
-            domain_counts, dnl_hg_acquisitions = self.count_domains_and_acquisitions(evaluations_raw)
+            # Single traversal of the raw acquisitions feeds both the domain scores and DNL HG
+            domain_totals, dnl_hg_acquisitions = self._scan_acquisitions(evaluations_raw)
+            domain_scores = self._score_domains(domain_totals)
 
             # Compute a single snapped DNL HG score (do not include in /400)
             dnl_hg_score = None
             if dnl_hg_acquisitions:
-                pts = [a.get("palier_points", 0) for a in dnl_hg_acquisitions]
-                raw_avg = sum(pts) / len(pts) if pts else 0.0
-                # snap thresholds
-                if raw_avg >= 45:
-                    snapped = 50
-                    pal = "V+"
-                elif raw_avg >= 32.5:
-                    snapped = 40
-                    pal = "V"
-                elif raw_avg >= 17.5:
-                    snapped = 25
-                    pal = "J"
-                else:
-                    snapped = 10
-                    pal = "R"
-
-                dnl_hg_score = {
-                    "count": len(pts),
-                    "avg_points_50": float(snapped),
-                    "avg_points_20": round(snapped * 0.4, 2),
-                    "palier": pal,
-                    "raw_avg": round(raw_avg, 2),
-                }
+                dnl_hg_score = palier_score(
+                    len(dnl_hg_acquisitions),
+                    sum(a["palier_points"] for a in dnl_hg_acquisitions),
+                )
 
             # Filter out EMPTY and compute totals
             official_domains = [d for d in domain_scores.keys() if d != "EMPTY"]
-            if official_domains:
-                # Total /400 = direct sum of all 8 domain scores (each domain is /50)
-                total_400 = sum(domain_scores[d]["avg_points_50"] for d in official_domains)
-            else:
-                total_400 = 0
+            # Total /400 = direct sum of all 8 domain scores (each domain is /50)
+            total_400 = sum(domain_scores[d]["avg_points_50"] for d in official_domains)
 
             return {
                 "domain_scores": domain_scores,
@@ -427,20 +622,123 @@ class PronoteAnalyzer:
 
     def get_performance_level(self, total_400: float) -> str:
         """Determine performance level based on total /400 score (sum of 8 domains /50)."""
-        if total_400 >= 360:
-            return gettext("Outstanding (Mention Très Bien avec Félicitations)")
-        elif total_400 >= 320:
-            return gettext("Excellent (Mention Très Bien possible)")
-        elif total_400 >= 280:
-            return gettext("Good (Mention Bien possible)")
-        elif total_400 >= 240:
-            return gettext("Satisfactory (Mention Assez Bien possible)")
-        elif total_400 >= 200:
-            return gettext("Pass level")
-        else:
-            return gettext("Below pass level")
+        return str(PERFORMANCE_LEVELS[bisect_right(PERFORMANCE_THRESHOLDS, total_400)])
+
+def build_results(analyzer: PronoteAnalyzer, evaluations: List[Dict], evaluations_raw: List, info: Dict) -> Dict:
+    """
+    Compute everything the result pages need, once per login.
+    The returned dict is stored per session and read as-is by /results, /api/data and /results/pdf.
+    """
+    # sort evaluations newest first using the date_obj field (fallback to minimal date)
+    evaluations_sorted = sorted(
+        evaluations,
+        key=lambda e: e.get("date_obj") or date.min,
+        reverse=True
+    )
+
+    subject_averages = analyzer.calculate_subject_averages(evaluations_sorted)
+    brevet_stats = analyzer.compute_brevet_stats(evaluations_raw)
+    performance_level = analyzer.get_performance_level(brevet_stats.get("total_400", 0))
+    logger.info("Computed stats: %d evaluations, total_400=%s", len(evaluations_sorted), brevet_stats.get("total_400"))
+
+    if not isinstance(info, dict):
+        info = {}
+    now = datetime.now()
+    results = {
+        "evaluations": evaluations_sorted,
+        "subject_averages": subject_averages,
+        "brevet_stats": brevet_stats,
+        "performance_level": performance_level,
+        "total_evaluations": len(evaluations_sorted),
+        # Human-friendly export/report metadata
+        "date": now.strftime("%d/%m/%Y"),
+        "year": now.year,
+        # student / class from Pronote client.info when available
+        "student_name": info.get("student_name"),
+        "class_name": info.get("class_name"),
+    }
+    # /api/data only changes on login: serialize it here instead of on every request
+    api_json = app.json.dumps(results)
+    results["api_json"] = api_json
+    results["api_etag"] = generate_etag(api_json.encode("utf-8"))
 
-analyzer = PronoteAnalyzer()
+    # PDF subjects list from domain_scores (only official domains, not EMPTY); kept out of /api/data
+    domain_scores = brevet_stats.get("domain_scores", {}) or {}
+    results["pdf_subjects"] = tuple(
+        {
+            "name": domain_name,
+            "score_50": score_data.get("avg_points_50", 0),
+            "score_20": score_data.get("avg_points_20", 0),
+        }
+        for domain_name, score_data in sorted(domain_scores.items())
+        if domain_name != 'EMPTY'
+    )
+    return results
+
+def fetch_results(analyzer: "PronoteAnalyzer", username: str, password: str) -> Tuple[bool, str, Optional[Dict]]:
+    """
+    Log in and build the per-session results, reusing a recent identical login when cached.
+    Returns (success, message, results); results is None on failure.
+    """
+    cache_key = LOGIN_CACHE.key(analyzer.fixed_url, username, password, str(get_locale()))
+    cached = LOGIN_CACHE.get(cache_key)
+    if cached is not None:
+        logger.info("Reusing cached results for user %s", username)
+        message, results = cached
+        return True, message, results
+
+    success, message, evaluations, info, evaluations_raw = analyzer.connect_and_fetch(username, password)
+    if not success:
+        return False, message, None
+
+    results = build_results(analyzer, evaluations, evaluations_raw, info)
+    LOGIN_CACHE.set(cache_key, message, results)
+    return True, message, results
+
+# ---------- PDF export ----------
+# WeasyPrint (and Pango/Fontconfig behind it) is loaded on the first export rather than at
+# startup; the font config and report stylesheet are then set up once and reused.
+# Fontconfig/Pango state isn't safe to share between concurrent renders, hence PDF_RENDER_LOCK.
+PDF_RENDER_LOCK = threading.Lock()
+
+@lru_cache(maxsize=None)
+def pdf_resources() -> Tuple[type, object, List]:
+    """(weasyprint.HTML, shared FontConfiguration, report stylesheets); call with PDF_RENDER_LOCK held."""
+    from weasyprint import CSS, HTML
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    stylesheets = [CSS(filename=os.path.join(app.static_folder, "css", "results_pdf.css"), font_config=font_config)]
+    return HTML, font_config, stylesheets
+
+# Relative URLs in the report resolve from static/ on disk, never over HTTP
+PDF_BASE_URL = Path(app.static_folder).resolve().as_uri() + "/"
+
+# Recently generated PDFs by hash of their HTML: downloading the same report again skips WeasyPrint
+PDF_CACHE_SIZE = 32
+PDF_CACHE: "OrderedDict[str, bytes]" = OrderedDict()
+PDF_CACHE_LOCK = threading.Lock()
+
+def render_pdf(rendered: str) -> bytes:
+    """PDF bytes for the rendered report HTML, reused from PDF_CACHE when identical."""
+    key = hashlib.blake2b(rendered.encode("utf-8"), digest_size=16).hexdigest()
+    with PDF_CACHE_LOCK:
+        pdf_bytes = PDF_CACHE.get(key)
+        if pdf_bytes is not None:
+            PDF_CACHE.move_to_end(key)
+            return pdf_bytes
+
+    # --- Patch : ne pas passer target=pdf_io, récupérer les bytes directement ---
+    with PDF_RENDER_LOCK:
+        HTML, font_config, stylesheets = pdf_resources()
+        pdf_bytes = HTML(string=rendered, base_url=PDF_BASE_URL).write_pdf(
+            stylesheets=stylesheets, font_config=font_config
+        )  # retourne les bytes
+    with PDF_CACHE_LOCK:
+        PDF_CACHE[key] = pdf_bytes
+        while len(PDF_CACHE) > PDF_CACHE_SIZE:
+            PDF_CACHE.popitem(last=False)
+    return pdf_bytes
 
 # ---------- Routes ----------
 
@@ -453,9 +751,6 @@ def index():
     form = LoginForm()
 
     if request.method == "POST":
-        logger.info(f"Form validation: {form.validate()}")
-        logger.info(f"Form errors: {form.errors}")
-
         if form.validate_on_submit():
             username = str(form.username.data).strip()
             password = str(form.password.data)
@@ -463,87 +758,39 @@ def index():
             # Determine which URL to use: preset or custom
             selected_url = request.form.get('pronote_url_select')
             custom_url = request.form.get('pronote_url_custom', '').strip()
-            logger.debug(f"User selected URL option: {selected_url}, custom provided: {'yes' if custom_url else 'no'}")
-            # If user chose Other and provided a custom URL, use it
-            if selected_url == 'other' and custom_url:
-                chosen_url = custom_url
-                logger.debug("Using custom Pronote URL provided by user")
-            else:
-                # Find matching preset URL by value
-                chosen_url = None
-                for p in DEFAULT_URL_PRESETS:
-                    if p.get('url') == selected_url or p.get('name') == selected_url:
-                        chosen_url = p.get('url')
-                        break
-                # Fallback to selected_url if it looks like a URL
-                if not chosen_url:
-                    chosen_url = selected_url
-                logger.debug(f"Resolved chosen_url from presets or selection: {chosen_url}")
-
-            # Validate chosen_url: allow query strings and trailing slashes by parsing path
-            try:
-                parsed = urlparse(str(chosen_url))
-                path = str(parsed.path or '')
-                normalized_path = path.rstrip('/')
-                logger.debug(f"Parsed URL path '{path}' -> normalized '{normalized_path}'")
-                if not normalized_path.endswith('/pronote') and not normalized_path.endswith('/eleve.html'):
-                    logger.info(f"Rejected Pronote URL on validation: {chosen_url}")
-                    flash(gettext("Please select or enter a valid Pronote URL that ends with /pronote or /eleve.html."), "error")
-                    return render_template("index.html", form=form, languages=app.config['LANGUAGES'], url_presets=DEFAULT_URL_PRESETS)
-            except Exception as e:
-                logger.warning(f"Error parsing Pronote URL '{chosen_url}': {e}")
-                flash(gettext("Please select or enter a valid Pronote URL that ends with /pronote or /eleve.html."), "error")
+            logger.debug("User selected URL option: %s, custom provided: %s", selected_url, "yes" if custom_url else "no")
+            chosen_url = resolve_pronote_url(selected_url, custom_url)
+            if chosen_url is None:
+                logger.info("Rejected Pronote URL on validation: %s", custom_url or selected_url)
+                flash(str(MSG_INVALID_URL), "error")
                 return render_template("index.html", form=form, languages=app.config['LANGUAGES'], url_presets=DEFAULT_URL_PRESETS)
+            logger.debug("Resolved chosen_url: %s", chosen_url)
 
-            # set analyzer.url for this run
-            analyzer.fixed_url = str(chosen_url)
-            logger.info(f"Set analyzer.fixed_url to {analyzer.fixed_url}")
+            # One analyzer per request: concurrent logins never share the chosen URL
+            analyzer = PronoteAnalyzer(chosen_url)
 
-            logger.info(f"Processing login for user: {username} against {analyzer.fixed_url}")
+            logger.info("Processing login for user: %s against %s", username, analyzer.fixed_url)
 
-            success, message, evaluations, info, evaluations_raw = analyzer.connect_and_fetch(username, password)
+            success, message, results = fetch_results(analyzer, username, password)
             if not success:
-                logger.info(f"Connection attempt failed for user {username}: {message}")
+                logger.info("Connection attempt failed for user %s: %s", username, message)
                 flash(gettext("Connection failed: %(message)s", message=message), "error")
                 return render_template("index.html", form=form)
 
-            # Compute and stash per-session results in memory
-            # sort evaluations newest first using the date_obj field (fallback to minimal date)
-            evaluations_sorted = sorted(
-                evaluations,
-                key=lambda e: e.get("date_obj") or date.min,
-                reverse=True
-            )
-
-            subject_averages = analyzer.calculate_subject_averages(evaluations_sorted)
-            brevet_stats = analyzer.compute_brevet_stats(evaluations_raw)
-            performance_level = analyzer.get_performance_level(brevet_stats.get("total_400", 0))
-            logger.info(f"Computed stats: {len(evaluations_sorted)} evaluations, total_400={brevet_stats.get('total_400')}")
-
-            STORE[session["sid"]] = {
-                "evaluations": evaluations_sorted,
-                "subject_averages": subject_averages,
-                "brevet_stats": brevet_stats,
-                "performance_level": performance_level,
-                "total_evaluations": len(evaluations_sorted),
-                # Human-friendly export/report metadata
-                "date": datetime.now().strftime("%d/%m/%Y"),
-                "year": datetime.now().year,
-                # student / class from Pronote client.info when available
-                "student_name": (info.get("student_name") if isinstance(info, dict) else "-") if 'info' in locals() else "-",
-                "class_name": (info.get("class_name") if isinstance(info, dict) else "-") if 'info' in locals() else "-",
-            }
+            # Stash per-session results
+            STORE.set(session["sid"], results)
 
             flash(gettext("Success: %(message)s", message=message), "success")
             return redirect(url_for("results"))
         else:
-            flash(gettext("Please check your input and try again."), "error")
+            logger.info("Form errors: %s", form.errors)
+            flash(str(MSG_CHECK_INPUT), "error")
 
     return render_template("index.html", form=form, languages=app.config['LANGUAGES'])
 
 @app.route("/set_language/<language>")
 def set_language(language=None):
-    if language in app.config["LANGUAGES"]:
+    if language in LANGUAGE_SET:
         session["language"] = language
     return redirect(request.referrer or url_for("index"))
 
@@ -556,89 +803,51 @@ def auto_login():
     try:
         data = request.get_json(force=True)
     except Exception:
-        return jsonify({"error": gettext("Invalid request")}), 400
+        return jsonify({"error": str(MSG_INVALID_REQUEST)}), 400
 
     if not data:
-        return jsonify({"error": gettext("Invalid request")}), 400
+        return jsonify({"error": str(MSG_INVALID_REQUEST)}), 400
 
     username = str(data.get('username') or '').strip()
     password_sha256 = str(data.get('password_sha256') or '')
 
     if not username or not password_sha256:
-        return jsonify({"error": gettext("Missing credentials")}), 400
+        return jsonify({"error": str(MSG_MISSING_CREDENTIALS)}), 400
 
     # determine chosen_url same as in index()
-    selected_url = data.get('pronote_url_select')
     custom_url = (data.get('pronote_url_custom') or '').strip()
-    if selected_url == 'other' and custom_url:
-        chosen_url = custom_url
-    else:
-        chosen_url = None
-        for p in DEFAULT_URL_PRESETS:
-            if p.get('url') == selected_url or p.get('name') == selected_url:
-                chosen_url = p.get('url')
-                break
-        if not chosen_url:
-            chosen_url = selected_url
-
-    # minimal URL validation (same relaxed check as index)
-    try:
-        parsed = urlparse(str(chosen_url))
-        path = str(parsed.path or '')
-        normalized_path = path.rstrip('/')
-        if not normalized_path.endswith('/pronote') and not normalized_path.endswith('/eleve.html'):
-            return jsonify({"error": gettext("Please select or enter a valid Pronote URL that ends with /pronote or /eleve.html.")}), 400
-    except Exception:
-        return jsonify({"error": gettext("Please select or enter a valid Pronote URL that ends with /pronote or /eleve.html.")}), 400
+    chosen_url = resolve_pronote_url(data.get('pronote_url_select'), custom_url)
+    if chosen_url is None:
+        return jsonify({"error": str(MSG_INVALID_URL)}), 400
 
     # Ensure session id
     if 'sid' not in session:
         session['sid'] = str(uuid4())
 
-    analyzer.fixed_url = str(chosen_url)
-    logger.info(f"Auto-login attempt for user {username} against {analyzer.fixed_url}")
+    analyzer = PronoteAnalyzer(chosen_url)
+    logger.info("Auto-login attempt for user %s against %s", username, analyzer.fixed_url)
 
     # NOTE: the client provides a SHA256(password) and we forward that string as the password to Pronotepy.
     # This keeps no plaintext stored on the server. If the remote service requires the raw password this
     # may fail and we'll return an error to the client which will clear its local storage.
-    success, message, evaluations, info, evaluations_raw = analyzer.connect_and_fetch(username, password_sha256)
+    success, message, results = fetch_results(analyzer, username, password_sha256)
     if not success:
-        logger.info(f"Auto-login failed for user {username}: {message}")
+        logger.info("Auto-login failed for user %s: %s", username, message)
         return jsonify({"error": message}), 401
 
-    evaluations_sorted = sorted(
-        evaluations,
-        key=lambda e: e.get("date_obj") or date.min,
-        reverse=True
-    )
+    STORE.set(session["sid"], results)
 
-    subject_averages = analyzer.calculate_subject_averages(evaluations_sorted)
-    brevet_stats = analyzer.compute_brevet_stats(evaluations_raw)
-    performance_level = analyzer.get_performance_level(brevet_stats.get("total_400", 0))
-
-    STORE[session["sid"]] = {
-        "evaluations": evaluations_sorted,
-        "subject_averages": subject_averages,
-        "brevet_stats": brevet_stats,
-        "performance_level": performance_level,
-        "total_evaluations": len(evaluations_sorted),
-        "date": datetime.now().strftime("%d/%m/%Y"),
-        "year": datetime.now().year,
-        "student_name": (info.get("student_name") if isinstance(info, dict) else "-") if 'info' in locals() else "-",
-        "class_name": (info.get("class_name") if isinstance(info, dict) else "-") if 'info' in locals() else "-",
-    }
-
-    logger.info(f"Auto-login success for sid={session['sid']} user={username}")
+    logger.info("Auto-login success for sid=%s user=%s", session["sid"], username)
     return jsonify({"redirect": url_for('results')}), 200
 
 @app.route("/results")
 def results():
     sid = session.get("sid")
-    if not sid or sid not in STORE:
-        flash(gettext("No data available. Please login first."), "warning")
+    data = STORE.get(sid) if sid else None
+    if data is None:
+        flash(str(MSG_NO_DATA), "warning")
         return redirect(url_for("index"))
 
-    data = STORE[sid]
     return render_template(
         "results.html",
         evaluations=data["evaluations"],
@@ -651,61 +860,58 @@ def results():
 @app.route("/api/data")
 def api_data():
     sid = session.get("sid")
-    if not sid or sid not in STORE:
+    data = STORE.get(sid) if sid else None
+    if data is None:
         return jsonify({"error": "No data available"}), 400
-    logger.debug(f"API data requested for sid={sid}")
-    return jsonify(STORE[sid])
+    logger.debug("API data requested for sid=%s", sid)
+    response = app.response_class(data["api_json"], mimetype="application/json")
+    response.set_etag(data["api_etag"])
+    # Per-user data: browsers may keep it but must revalidate (304 when unchanged)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+SPECIFIC_FILE_PATH = os.path.join(app.root_path, 'd8848862cac0447f833f83d1c3afcae3.txt')
 
 @app.route('/d8848862cac0447f833f83d1c3afcae3.txt')
 def download_specific_file():
-    file_path = os.path.join(app.root_path, 'd8848862cac0447f833f83d1c3afcae3.txt')
-    return send_file(file_path)
+    # Static file: cacheable for a day, revalidated with ETag/Last-Modified (304 when unchanged)
+    return send_file(SPECIFIC_FILE_PATH, conditional=True, max_age=86400)
 
 @app.route("/results/pdf")
 def export_pdf():
     sid = session.get("sid")
-    if not sid or sid not in STORE:
-        flash(gettext("No data available. Please login first."), "warning")
+    data = STORE.get(sid) if sid else None
+    if data is None:
+        flash(str(MSG_NO_DATA), "warning")
         return redirect(url_for("index"))
 
-    data = STORE[sid]
     brevet_stats = data.get("brevet_stats", {})
 
-    # Build subjects list from domain_scores (only official domains, not EMPTY)
-    subjects = []
-    domain_scores = brevet_stats.get("domain_scores", {}) or {}
-    for domain_name in sorted([d for d in domain_scores.keys() if d != 'EMPTY']):
-        score_data = domain_scores[domain_name]
-        subjects.append({
-            "name": domain_name,
-            "score_50": score_data.get("avg_points_50", 0),
-            "score_20": score_data.get("avg_points_20", 0),
-        })
-
     performance_level = data.get("performance_level", gettext("Unknown"))
 
-    logger.info(f"Generating PDF for sid={sid}, student={data.get('student_name')}")
+    logger.info("Generating PDF for sid=%s, student=%s", sid, data.get("student_name"))
     rendered = render_template(
         "results_pdf.html",
         year=data.get("year", ""),
         student_name=data.get("student_name", "-"),
         class_name=data.get("class_name", "-"),
         date=data.get("date", ""),
-        subjects=subjects,
+        subjects=data["pdf_subjects"],
         total_400=brevet_stats.get("total_400", 0),
         performance_level=performance_level,
         )
-    # --- Patch : ne pas passer target=pdf_io, récupérer les bytes directement ---
-    pdf_bytes = HTML(string=rendered, base_url=request.url_root).write_pdf()  # retourne les bytes
-    pdf_io = BytesIO(pdf_bytes)  # convertir en BytesIO pour send_file
-
-    return send_file(
-        pdf_io,
-        mimetype="application/pdf",
-        as_attachment=True,
-        download_name="brevet_report.pdf"
-        )
+    pdf_bytes = render_pdf(rendered)
+
+    # The bytes are already in memory: send them as-is rather than copying through BytesIO/send_file
+    response = app.response_class(pdf_bytes, mimetype="application/pdf")
+    response.headers.set("Content-Disposition", "attachment", filename="brevet_report.pdf")
+    # Per-student report: like /api/data, never shared and always revalidated
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 if __name__ == "__main__":
-    # For local testing only; Railway uses Gunicorn
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # For local testing only; Railway uses Gunicorn (see Procfile).
+    # The debugger is opt-in (FLASK_DEBUG=1) since it is reachable on every interface.
+    app.run(host="0.0.0.0", port=5000, debug=os.environ.get("FLASK_DEBUG") == "1")